@@ -5,8 +5,11 @@ Stack: Flask + Flask-SQLAlchemy (SQLite)
 Passwords are stored as plain text for simplicity.
 """
 
+import atexit
 import os
-import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -15,6 +18,10 @@ from flask import (
     session, jsonify, flash, abort
 )
 from flask_sqlalchemy import SQLAlchemy
+import pandas as pd
+from sqlalchemy import bindparam, event, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.utils import secure_filename
 
 # ---------------------------------------------------------------------
 # Configuration
@@ -28,8 +35,33 @@ app = Flask(__name__)
 app.config["SECRET_KEY"] = os.environ.get("FLASK_SECRET", "change-this-secret")
 app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DB_FILE}"
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-db = SQLAlchemy(app)
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+    "pool_size": 10,
+    "max_overflow": 20,
+    "pool_pre_ping": True,
+    # Connections are shared across server threads; wait on a locked DB
+    # instead of failing immediately.
+    "connect_args": {"check_same_thread": False, "timeout": 30},
+}
+
+# Sessions are request-scoped, so objects don't need re-reading after each commit
+db = SQLAlchemy(app, session_options={"expire_on_commit": False})
+
+
+def _set_sqlite_pragmas(dbapi_conn, _record):
+    # WAL lets readers run alongside the single writer; NORMAL sync is
+    # durable enough in WAL mode and avoids an fsync on every commit.
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-64000")  # ~64 MB page cache
+    cur.execute("PRAGMA mmap_size=268435456")  # 256 MB
+    cur.close()
+
+
+with app.app_context():
+    event.listen(db.engine, "connect", _set_sqlite_pragmas)
 
 # ---------------------------------------------------------------------
 # Database models
@@ -76,6 +108,9 @@ class Exam(db.Model):
     total_score = db.Column(db.Float, default=0)
     status = db.Column(db.String(20), default="active")
     duration_minutes = db.Column(db.Integer, default=30)
+    deadline = db.Column(db.DateTime, index=True)  # start_time + duration_minutes
+    grading_started_at = db.Column(db.DateTime)  # when the exam was last claimed for grading
+    grading_attempts = db.Column(db.Integer, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Optional relationship
@@ -89,6 +124,10 @@ class ExamQuestion(db.Model):
     question_id = db.Column(db.Integer, db.ForeignKey("questions.id"), nullable=False)
     question_order = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (
+        db.Index("ix_examq_exam_order", "exam_id", "question_order"),
+    )
+
 # -------------------- ExamAnswer --------------------
 class ExamAnswer(db.Model):
     __tablename__ = "exam_answers"
@@ -100,15 +139,48 @@ class ExamAnswer(db.Model):
     is_correct = db.Column(db.Boolean, default=False)
     score = db.Column(db.Float, default=0) 
 
+    # One answer per question; also serves exam_id-only lookups (leftmost prefix)
+    __table_args__ = (
+        db.Index("ix_examanswer_exam_qid", "exam_id", "question_id", unique=True),
+    )
+
 # -------------------- AuditLog --------------------
 class AuditLog(db.Model):
     __tablename__ = "audit_logs"
     id = db.Column(db.Integer, primary_key=True)
-    student_id = db.Column(db.Integer, nullable=True)
+    student_id = db.Column(db.Integer, nullable=True, index=True)
     action = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# ---------------------------------------------------------------------
+# Hot-path statements
+# ---------------------------------------------------------------------
+
+# Built once at import; SQLAlchemy caches the compiled SQL for each, so
+# per-request work is just binding :eid.
+GET_ANSWERS = select(ExamAnswer).where(ExamAnswer.exam_id == bindparam("eid"))
+
+GET_ANSWERS_FOR_GRADING = (
+    select(ExamAnswer.id, ExamAnswer.question_id, ExamAnswer.student_answer)
+    .where(ExamAnswer.exam_id == bindparam("eid"))
+)
+
+GET_ANSWER_COUNTS = (
+    select(
+        db.func.count().label("total"),
+        db.func.sum(db.case((ExamAnswer.is_correct, 1), else_=0)).label("correct")
+    )
+    .where(ExamAnswer.exam_id == bindparam("eid"))
+)
+
+GET_EXAM_QUESTION_LINKS = (
+    select(ExamQuestion.question_order, ExamQuestion.question_id)
+    .where(ExamQuestion.exam_id == bindparam("eid"))
+    .order_by(ExamQuestion.question_order)
+)
+
+
 # ---------------------------------------------------------------------
 # Utilities & helpers
 # ---------------------------------------------------------------------
@@ -117,6 +189,39 @@ class AuditLog(db.Model):
 def init_db():
     db.create_all()
 
+    # Databases created before these exams columns existed: add (and backfill) them
+    exam_columns = {c["name"] for c in db.inspect(db.engine).get_columns("exams")}
+    if "deadline" not in exam_columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE exams ADD COLUMN deadline DATETIME"))
+            conn.execute(db.text(
+                "UPDATE exams SET deadline = datetime(start_time, '+' || duration_minutes || ' minutes') "
+                "WHERE start_time IS NOT NULL"
+            ))
+    for name, ddl in (("grading_started_at", "DATETIME"), ("grading_attempts", "INTEGER DEFAULT 0")):
+        if name not in exam_columns:
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f"ALTER TABLE exams ADD COLUMN {name} {ddl}"))
+
+    # Older databases may hold duplicate answers (the old submit path was
+    # SELECT-then-INSERT); keep the newest per question so the UNIQUE index
+    # that submit_exam's ON CONFLICT relies on can be built
+    answer_indexes = {i["name"]: i for i in db.inspect(db.engine).get_indexes("exam_answers")}
+    existing = answer_indexes.get("ix_examanswer_exam_qid")
+    if existing is None or not existing["unique"]:
+        with db.engine.begin() as conn:
+            if existing is not None:
+                conn.execute(db.text("DROP INDEX ix_examanswer_exam_qid"))
+            conn.execute(db.text(
+                "DELETE FROM exam_answers WHERE id NOT IN "
+                "(SELECT MAX(id) FROM exam_answers GROUP BY exam_id, question_id)"
+            ))
+
+    # create_all() skips indexes on tables that already exist
+    for table in db.metadata.tables.values():
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
 
 def login_required_student(f):
     @wraps(f)
@@ -138,73 +243,209 @@ def login_required_admin(f):
     return decorated
 
 
+def normalize_answer(text):
+    return text.strip().lower()
+
+
+# Questions are only written by admins, so keep
+# {id: (question_text, model_answer, normalized model_answer)}
+# in memory for the grading and results paths.
+QUESTION_CACHE = {}
+
+
+def cache_question(qid, question_text, model_answer):
+    entry = (question_text, model_answer, normalize_answer(model_answer))
+    QUESTION_CACHE[qid] = entry
+    return entry
+
+
+def load_question_cache():
+    rows = db.session.query(Question.id, Question.question_text, Question.model_answer).all()
+    QUESTION_CACHE.clear()
+    for qid, text, answer in rows:
+        cache_question(qid, text, answer)
+
+
+def get_cached_questions(question_ids):
+    """Return {id: (question_text, model_answer, normalized model_answer)}, reading only cache misses from the DB."""
+    found = {}
+    missing = []
+    for qid in question_ids:
+        entry = QUESTION_CACHE.get(qid)
+        if entry is None:
+            missing.append(qid)
+        else:
+            found[qid] = entry
+
+    # Another worker may have added questions since this cache was loaded
+    if missing:
+        rows = (
+            db.session.query(Question.id, Question.question_text, Question.model_answer)
+            .filter(Question.id.in_(missing))
+            .all()
+        )
+        for qid, text, answer in rows:
+            found[qid] = cache_question(qid, text, answer)
+    return found
+
+
+_question_cache_warmed = False
+_question_cache_lock = threading.Lock()
+
+
+@app.before_request
+def warm_question_cache():
+    # WSGI servers import app:app without running __main__, so fill the
+    # cache on the first request of each process
+    global _question_cache_warmed
+    if _question_cache_warmed:
+        return
+    with _question_cache_lock:
+        if not _question_cache_warmed:
+            load_question_cache()
+            _question_cache_warmed = True
+
+
+# Audit rows are buffered and written in batches rather than one commit per event
+LOG_BUFFER = []
+LOG_LOCK = threading.Lock()
+LOG_BATCH_SIZE = 50
+LOG_FLUSH_INTERVAL = 5  # seconds
+_last_log_flush = time.monotonic()
+
+
 def add_log(student_id, action):
-    log = AuditLog(student_id=student_id, action=action)
-    db.session.add(log)
-    db.session.commit()
+    with LOG_LOCK:
+        LOG_BUFFER.append({"student_id": student_id, "action": action, "timestamp": datetime.utcnow()})
+        full = len(LOG_BUFFER) >= LOG_BATCH_SIZE
+    if full:
+        flush_logs()
+
+
+def flush_logs():
+    global _last_log_flush
+    with LOG_LOCK:
+        batch = LOG_BUFFER[:]
+        LOG_BUFFER.clear()
+        _last_log_flush = time.monotonic()
+    if not batch:
+        return
 
+    # Use the engine directly so a flush never commits a request's pending session state
+    try:
+        with app.app_context():
+            with db.engine.begin() as conn:
+                conn.execute(AuditLog.__table__.insert(), batch)
+    except Exception:
+        # Keep the batch for the next flush; an audit hiccup shouldn't fail the request
+        with LOG_LOCK:
+            LOG_BUFFER[:0] = batch
+        app.logger.exception("Flushing %d audit log entries failed", len(batch))
+
+
+@app.teardown_appcontext
+def flush_stale_logs(_exc):
+    if LOG_BUFFER and time.monotonic() - _last_log_flush >= LOG_FLUSH_INTERVAL:
+        flush_logs()
 
-def create_exam_for_student(student_id, num_questions=50, duration_minutes=60):
-    exam = Exam(student_id=student_id, start_time=datetime.utcnow(),
-                duration_minutes=duration_minutes, status="in-progress")
-    db.session.add(exam)
-    db.session.commit()
 
-    all_qs = Question.query.all()
-    if not all_qs:
+atexit.register(flush_logs)
+
+
+def create_exam_for_student(student_id, num_questions=50, duration_minutes=60):
+    # Let SQLite pick the sample so only the chosen ids are loaded
+    selected_ids = [
+        qid for (qid,) in db.session.query(Question.id)
+        .order_by(db.func.random())
+        .limit(num_questions)
+    ]
+    if not selected_ids:
         return None
-    selected = random.sample(all_qs, min(num_questions, len(all_qs)))
 
-    for idx, q in enumerate(selected, start=1):
-        eq = ExamQuestion(exam_id=exam.id, question_id=q.id, question_order=idx)
-        db.session.add(eq)
+    start = datetime.utcnow()
+    exam = Exam(student_id=student_id, start_time=start,
+                duration_minutes=duration_minutes, status="in-progress",
+                deadline=start + timedelta(minutes=duration_minutes))
+    db.session.add(exam)
+    db.session.flush()  # assigns exam.id without committing
+
+    # Exam and its question links go out in one transaction
+    rows = [
+        {"exam_id": exam.id, "question_id": qid, "question_order": idx}
+        for idx, qid in enumerate(selected_ids, start=1)
+    ]
+    db.session.bulk_insert_mappings(ExamQuestion, rows)
     db.session.commit()
 
-    add_log(student_id, f"Started exam {exam.id} with {len(selected)} questions")
+    add_log(student_id, f"Started exam {exam.id} with {len(selected_ids)} questions")
     return exam
 
 
 import difflib
 
-def grade_answer_text(student_answer, model_answer):
-    if not student_answer:
-        return False, 0
+try:
+    import difflib_fast  # Rust port of SequenceMatcher.ratio(), identical scores
+except ImportError:
+    difflib_fast = None
+
+
+SIMILARITY_THRESHOLD = 0.60  # 60% similarity is correct
 
-    # Normalize text
-    s = student_answer.strip().lower()
-    m = model_answer.strip().lower()
 
-    # Compute similarity between 0 and 1
-    similarity = difflib.SequenceMatcher(None, s, m).ratio()
+def length_bound(a, b):
+    # Same upper bound as SequenceMatcher.real_quick_ratio(): the matched
+    # length can never exceed the shorter string.
+    total = len(a) + len(b)
+    return 2.0 * min(len(a), len(b)) / total if total else 0.0
 
-    # Decide correct/wrong based on threshold
-    is_correct = similarity >= 0.60  # 60% similarity is correct
-    score = 1 if is_correct else 0
 
-    return is_correct, score
+def similarity_ratios(pairs):
+    # The batch form runs across all cores inside Rust with the GIL released
+    if difflib_fast is not None:
+        return difflib_fast.ratio(pairs)
+    return [difflib.SequenceMatcher(None, a, b, autojunk=False).ratio() for a, b in pairs]
 
 
+def grade_answers(pairs):
+    """Grade a list of (student_answer, normalized model_answer) pairs in one call."""
+    normalized = [(normalize_answer(s or ""), m) for s, m in pairs]
 
-def grade_exam(exam_id):
+    # Only pairs whose length bound reaches the threshold need a real ratio
+    candidates = [
+        i for i, (s, m) in enumerate(normalized)
+        if s and length_bound(s, m) >= SIMILARITY_THRESHOLD
+    ]
+    similarities = similarity_ratios([normalized[i] for i in candidates])
+    passed = {i for i, similarity in zip(candidates, similarities) if similarity >= SIMILARITY_THRESHOLD}
+
+    return [(i in passed, 1 if i in passed else 0) for i in range(len(normalized))]
+
+
+
+def grade_exam(exam_id, final_status="completed", end_time=None):
     exam = Exam.query.get(exam_id)
-    answers = ExamAnswer.query.filter_by(exam_id=exam_id).all()
-    total_score = 0
 
-    for ans in answers:
-        q = Question.query.get(ans.question_id)
-        if not q:
-            continue
+    answers = db.session.execute(GET_ANSWERS_FOR_GRADING, {"eid": exam_id}).all()
+    questions = get_cached_questions({a.question_id for a in answers})
+    rows = [
+        (ans_id, student_answer, questions[qid][2])
+        for ans_id, qid, student_answer in answers
+        if qid in questions
+    ]
+    total_score = 0
+    updates = []
 
-        # Compare student's answer with model_answer
-        is_correct, score = grade_answer_text(ans.student_answer or "", q.model_answer)
-        ans.is_correct = is_correct
-        ans.score = score
+    # Compare every student answer with its model_answer in a single batch
+    grades = grade_answers([(student_answer, model_norm) for _, student_answer, model_norm in rows])
+    for (ans_id, _, _), (is_correct, score) in zip(rows, grades):
+        updates.append({"id": ans_id, "is_correct": is_correct, "score": score})
         total_score += score
 
-        db.session.add(ans)
+    db.session.bulk_update_mappings(ExamAnswer, updates)
 
     exam.total_score = total_score
-    exam.status = "completed"
+    exam.status = final_status
+    exam.end_time = end_time or datetime.utcnow()
     db.session.add(exam)
     db.session.commit()
 
@@ -212,32 +453,167 @@ def grade_exam(exam_id):
 
 
 
+# Background graders for submitted exams
+GRADER = ThreadPoolExecutor(max_workers=2)
+
+
+GRADING_STALE_AFTER = timedelta(minutes=10)  # since the exam was claimed for grading
+MAX_GRADING_ATTEMPTS = 3
+
+
+def grade_exam_worker(exam_id):
+    with app.app_context():
+        try:
+            grade_exam(exam_id)
+        except Exception:
+            app.logger.exception("Grading exam %s failed", exam_id)
+            # Leave a status the sweeper retries instead of 'grading' forever
+            try:
+                db.session.rollback()
+                db.session.execute(
+                    update(Exam)
+                    .where(Exam.id == exam_id, Exam.status == "grading")
+                    .values(status="grading-failed")
+                )
+                db.session.commit()
+                attempts = db.session.get(Exam, exam_id).grading_attempts or 0
+                if attempts >= MAX_GRADING_ATTEMPTS:
+                    app.logger.error("Giving up on grading exam %s after %d attempts", exam_id, attempts)
+            except Exception:
+                app.logger.exception("Marking exam %s as grading-failed failed", exam_id)
+
+
+def regrade_stuck_exams():
+    """Re-queue exams whose background grading failed or never finished."""
+    now = datetime.utcnow()
+    stale_before = now - GRADING_STALE_AFTER
+    retryable = db.and_(
+        db.or_(
+            Exam.status == "grading-failed",
+            # A worker that died with its process leaves the exam in 'grading'
+            db.and_(Exam.status == "grading", db.or_(
+                Exam.grading_started_at < stale_before,
+                Exam.grading_started_at.is_(None)
+            ))
+        ),
+        db.func.coalesce(Exam.grading_attempts, 0) < MAX_GRADING_ATTEMPTS
+    )
+    stuck_ids = [eid for (eid,) in db.session.query(Exam.id).filter(retryable)]
+
+    requeued = 0
+    for exam_id in stuck_ids:
+        # Claim before queueing so other processes and later sweeps skip it
+        claimed = db.session.execute(
+            update(Exam)
+            .where(Exam.id == exam_id, retryable)
+            .values(
+                status="grading",
+                grading_started_at=now,
+                grading_attempts=db.func.coalesce(Exam.grading_attempts, 0) + 1
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.session.commit()
+        if claimed.rowcount == 1:
+            GRADER.submit(grade_exam_worker, exam_id)
+            requeued += 1
+    return requeued
+
+
 def check_time_allowed(exam):
-    if not exam.start_time:
+    if not exam.deadline:
         return False
-    limit = exam.start_time + timedelta(minutes=exam.duration_minutes)
-    return datetime.utcnow() <= limit
+    return datetime.utcnow() <= exam.deadline
+
+
+def claim_exam(exam_id):
+    """Move an in-progress exam to 'grading'; False if another caller got there first.
+
+    The UPDATE is left uncommitted so the claim and the grading that follows
+    commit, or roll back, together. Under SQLite it also holds the write lock,
+    which serializes competing claimers.
+    """
+    claimed = db.session.execute(
+        update(Exam)
+        .where(Exam.id == exam_id, Exam.status == "in-progress")
+        .values(status="grading", grading_started_at=datetime.utcnow(), grading_attempts=1)
+        # Only refresh loaded Exam objects for rows the UPDATE actually matched
+        .execution_options(synchronize_session="fetch")
+    )
+    return claimed.rowcount == 1
 
 
 def auto_submit_exam(exam):
-    q_links = ExamQuestion.query.filter_by(exam_id=exam.id).all()
-    existing_qids = {a.question_id for a in ExamAnswer.query.filter_by(exam_id=exam.id).all()}
-    for ql in q_links:
-        if ql.question_id not in existing_qids:
-            placeholder = ExamAnswer(exam_id=exam.id, question_id=ql.question_id, student_answer="")
-            db.session.add(placeholder)
-    db.session.commit()
-    total = grade_exam(exam.id)
-    exam = Exam.query.get(exam.id)
-    exam.status = "auto-submitted"
-    exam.end_time = datetime.utcnow()
-    exam.total_score = total
-    db.session.add(exam)
-    db.session.commit()
+    """Auto-submit an expired exam; returns None if it was already submitted."""
+    if not claim_exam(exam.id):
+        return None
+
+    q_links = db.session.execute(GET_EXAM_QUESTION_LINKS, {"eid": exam.id}).all()
+
+    # Blank answers for unanswered questions; existing answers are left alone
+    placeholders = [
+        {"exam_id": exam.id, "question_id": ql.question_id,
+         "student_id": exam.student_id, "student_answer": ""}
+        for ql in q_links
+    ]
+    if placeholders:
+        stmt = sqlite_insert(ExamAnswer).values(placeholders)
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=["exam_id", "question_id"]))
+
+    # Grading sets the final status and commits everything at once
+    total = grade_exam(exam.id, "auto-submitted", datetime.utcnow())
     add_log(exam.student_id, f"Exam {exam.id} auto-submitted with score {total}")
     return total
 
 
+SWEEP_INTERVAL = 60  # seconds
+_sweeper_started = False
+_sweeper_lock = threading.Lock()
+
+
+def sweep_expired_exams():
+    """Auto-submit every in-progress exam whose deadline has passed."""
+    expired_ids = [
+        eid for (eid,) in db.session.query(Exam.id)
+        .filter(Exam.status == "in-progress", Exam.deadline < datetime.utcnow())
+    ]
+
+    swept = 0
+    for exam_id in expired_ids:
+        try:
+            # Claim and grade in one transaction: a failure rolls the claim
+            # back to 'in-progress' so the next sweep retries the exam
+            if auto_submit_exam(db.session.get(Exam, exam_id)) is not None:
+                swept += 1
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Auto-submitting exam %s failed", exam_id)
+    return swept
+
+
+def _sweeper_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        with app.app_context():
+            try:
+                sweep_expired_exams()
+                regrade_stuck_exams()
+            except Exception:
+                app.logger.exception("Expired exam sweep failed")
+
+
+@app.before_request
+def start_sweeper():
+    # Started lazily so CLI commands don't spawn it; once per process
+    global _sweeper_started
+    if _sweeper_started:
+        return
+    with _sweeper_lock:
+        if not _sweeper_started:
+            threading.Thread(target=_sweeper_loop, name="exam-sweeper", daemon=True).start()
+            _sweeper_started = True
+
+
 # ---------------------------------------------------------------------
 # Routes - Student
 # ---------------------------------------------------------------------
@@ -309,11 +685,11 @@ def start_exam():
     student_id = session["student_id"]
 
     # Optional: mark old in-progress exams as completed
-    old_exams = Exam.query.filter_by(student_id=student_id, status="in-progress").all()
-    for e in old_exams:
-        e.status = "completed"
-        e.end_time = datetime.utcnow()
-        db.session.add(e)
+    db.session.execute(
+        update(Exam)
+        .where(Exam.student_id == student_id, Exam.status == "in-progress")
+        .values(status="completed", end_time=datetime.utcnow())
+    )
     db.session.commit()
 
     # Create new exam
@@ -332,8 +708,7 @@ def exam_page(exam_id):
     exam = Exam.query.get_or_404(exam_id)
     if exam.student_id != session["student_id"]:
         abort(403)
-    limit = exam.start_time + timedelta(minutes=exam.duration_minutes)
-    remaining = int((limit - datetime.utcnow()).total_seconds())
+    remaining = int((exam.deadline - datetime.utcnow()).total_seconds())
     if remaining < 0:
         if exam.status == "in-progress":
             auto_submit_exam(exam)
@@ -348,18 +723,31 @@ def api_get_exam_questions(exam_id):
     if exam.student_id != session["student_id"]:
         abort(403)
 
-    qlinks = ExamQuestion.query.filter_by(exam_id=exam_id).order_by(ExamQuestion.question_order).all()
+    # An exam's questions never change once selected, so the id is a stable tag
+    etag = f"exam-{exam_id}-qs"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        response.cache_control.private = True
+        return response
+
+    qlinks = db.session.execute(GET_EXAM_QUESTION_LINKS, {"eid": exam_id}).all()
+    questions = get_cached_questions({ql.question_id for ql in qlinks})
 
     payload = []
-    for ql in qlinks:
-        q = Question.query.get(ql.question_id)
+    for question_order, question_id in qlinks:
+        if question_id not in questions:
+            continue
         payload.append({
-            "question_order": ql.question_order,
-            "question_id": q.id,  # FIXED
-            "question_text": q.question_text  # FIXED
+            "question_order": question_order,
+            "question_id": question_id,
+            "question_text": questions[question_id][0]
         })
 
-    return jsonify({"exam_id": exam_id, "questions": payload})
+    response = jsonify({"exam_id": exam_id, "questions": payload})
+    response.set_etag(etag)
+    response.cache_control.private = True
+    return response
 
 
 
@@ -372,10 +760,10 @@ def submit_exam(exam_id):
 
     # Check if time expired
     if not check_time_allowed(exam):
-        auto_submit_exam(exam)
-        flash("Time expired; exam auto-submitted.", "warning")
+        if auto_submit_exam(exam) is not None:
+            flash("Time expired; exam auto-submitted.", "warning")
         return jsonify({
-            "status": "auto-submitted",
+            "status": exam.status,
             "redirect": url_for("results_page", exam_id=exam_id)
         }), 200
 
@@ -384,46 +772,43 @@ def submit_exam(exam_id):
     if not data or "answers" not in data:
         return jsonify({"error": "Invalid payload"}), 400
 
+    # Only the first submission counts; a late or repeated POST just gets redirected
+    if not claim_exam(exam_id):
+        return jsonify({
+            "status": exam.status,
+            "redirect": url_for("results_page", exam_id=exam_id)
+        }), 200
+
     answers = data["answers"]
+    rows = []
     for item in answers:
         qid = item.get("question_id")
         ans_text = item.get("answer", "")
         if qid is None:
             continue  # skip invalid entries
 
-        existing = ExamAnswer.query.filter_by(exam_id=exam_id, question_id=qid).first()
-        if existing:
-            existing.student_answer = ans_text
-            db.session.add(existing)
-        else:
-            new_answer = ExamAnswer(
-                exam_id=exam_id,
-                question_id=qid,
-                student_id=exam.student_id,  # ensure student_id is recorded
-                student_answer=ans_text
-            )
-            db.session.add(new_answer)
+        rows.append({
+            "exam_id": exam_id,
+            "question_id": qid,
+            "student_id": exam.student_id,  # ensure student_id is recorded
+            "student_answer": ans_text
+        })
 
-    db.session.commit()
+    # Insert new answers and overwrite resubmitted ones in a single statement
+    if rows:
+        stmt = sqlite_insert(ExamAnswer).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["exam_id", "question_id"],
+            set_={"student_answer": stmt.excluded.student_answer}
+        )
+        db.session.execute(stmt)
+    db.session.commit()  # answers and the 'grading' claim together
 
-    # Grade the exam
-    total_score = 0
-    exam_answers = ExamAnswer.query.filter_by(exam_id=exam_id).all()
-    for ans in exam_answers:
-        q = Question.query.get(ans.question_id)
-        is_correct, score = grade_answer_text(ans.student_answer or "", q.model_answer)
-        ans.is_correct = is_correct
-        ans.score = score
-        total_score += score
-        db.session.add(ans)
-    exam.total_score = total_score
-    exam.status = "completed"
-    db.session.add(exam)
-    db.session.commit()
+    # Grade off the request thread; the results page polls until it's done
+    GRADER.submit(grade_exam_worker, exam_id)
 
     return jsonify({
-        "status": "graded",
-        "total_score": total_score,
+        "status": "grading",
         "redirect": url_for("results_page", exam_id=exam_id)
     }), 200
 
@@ -437,16 +822,19 @@ def results_page(exam_id):
     if exam.student_id != session["student_id"]:
         abort(403)
 
-    answers = ExamAnswer.query.filter_by(exam_id=exam_id).all()
+    answers = db.session.scalars(GET_ANSWERS, {"eid": exam_id}).all()
+    questions = get_cached_questions({a.question_id for a in answers})
     results = []
 
     for a in answers:
-        q = Question.query.get(a.question_id)
+        if a.question_id not in questions:
+            continue
+        question_text, model_answer, _ = questions[a.question_id]
         results.append({
-            "question_id": q.id,
-            "question_text": q.question_text,
+            "question_id": a.question_id,
+            "question_text": question_text,
             "student_answer": a.student_answer,
-            "correct_answer": q.model_answer,  # use model_answer here
+            "correct_answer": model_answer,  # use model_answer here
             "is_correct": a.is_correct,
             "score": a.score
         })
@@ -463,25 +851,19 @@ def api_results_data(exam_id):
     exam = Exam.query.get_or_404(exam_id)
     if exam.student_id != session["student_id"]:
         abort(403)
-    answers = ExamAnswer.query.filter_by(exam_id=exam_id).all()
-    max_score = len(answers)
-    correct = sum(1 for a in answers if a.is_correct)
+    # Count answers in SQL rather than loading every row
+    row = db.session.execute(GET_ANSWER_COUNTS, {"eid": exam_id}).one()
+    max_score = row.total
+    correct = row.correct or 0
     incorrect = max_score - correct
-    topic_summary = {}
-    for a in answers:
-        q = Question.query.get(a.question_id)
-        topic = "General"
-
-        if topic not in topic_summary:
-            topic_summary[topic] = {"total": 0, "correct": 0}
-        topic_summary[topic]["total"] += 1
-        if a.is_correct:
-            topic_summary[topic]["correct"] += 1
-    topics = list(topic_summary.keys())
-    topic_correct = [topic_summary[t]["correct"] for t in topics]
-    topic_total = [topic_summary[t]["total"] for t in topics]
+
+    # Questions carry no topic yet, so everything is reported under "General"
+    topics = ["General"] if max_score else []
+    topic_correct = [correct] if max_score else []
+    topic_total = [max_score] if max_score else []
     return jsonify({
         "exam_id": exam_id,
+        "status": exam.status,
         "total_score": exam.total_score,
         "max_score": max_score,
         "correct_count": correct,
@@ -539,6 +921,7 @@ def admin_add_question():
         q = Question(question_text=question_text, model_answer=model_answer)
         db.session.add(q)
         db.session.commit()
+        cache_question(q.id, q.question_text, q.model_answer)
 
         flash("Question added successfully!", "success")
         return redirect(url_for("admin_dashboard"))
@@ -546,6 +929,9 @@ def admin_add_question():
     return render_template("admin_add_question.html")
 
 
+UPLOAD_CHUNK_SIZE = 10000
+
+
 @app.route("/admin/upload_exam", methods=["GET", "POST"])
 def admin_upload_exam():
     if request.method == "POST":
@@ -553,18 +939,20 @@ def admin_upload_exam():
         if file and file.filename.endswith(".xlsx"):
             filepath = os.path.join("uploads", secure_filename(file.filename))
             file.save(filepath)
-            df = pd.read_excel(filepath)
+            df = pd.read_excel(filepath, engine="openpyxl")
             required_cols = ["Question Text", "Model Answer"]
             if not all(col in df.columns for col in required_cols):
                 flash("Excel must contain 'Question Text' and 'Model Answer'", "error")
                 return redirect(request.url)
-            for _, row in df.iterrows():
-                q = Question(
-                    question_text=row["Question Text"],
-                    model_answer=row["Model Answer"]
-                )
-                db.session.add(q)
+            # Read whole columns rather than building a Series per row
+            records = [
+                {"question_text": text, "model_answer": answer}
+                for text, answer in zip(df["Question Text"].tolist(), df["Model Answer"].tolist())
+            ]
+            for start in range(0, len(records), UPLOAD_CHUNK_SIZE):
+                db.session.bulk_insert_mappings(Question, records[start:start + UPLOAD_CHUNK_SIZE])
             db.session.commit()
+            load_question_cache()
             flash("Questions loaded successfully!", "success")
             return redirect(url_for("admin_dashboard"))
     return render_template("admin_upload.html")
@@ -581,6 +969,15 @@ def cli_init_db():
     print("Database initialized.")
 
 
+@app.cli.command("sweep-exams")
+def cli_sweep_exams():
+    swept = sweep_expired_exams()
+    requeued = regrade_stuck_exams()
+    GRADER.shutdown(wait=True)
+    flush_logs()
+    print(f"Auto-submitted {swept} expired exams, re-graded {requeued} stuck exams.")
+
+
 @app.cli.command("create-admin")
 def cli_create_admin():
     username = input("Admin username: ").strip()
@@ -617,8 +1014,11 @@ def not_found(e):
 # Main
 # ---------------------------------------------------------------------
 
+# Development server only. In production run a WSGI server instead, e.g.
+#   gunicorn -k gthread -w 2 --threads 8 app:app
+#   waitress-serve --threads=8 app:app   (Windows)
 if __name__ == "__main__":
     with app.app_context():
         init_db()
-    app.run(debug=True)
+    app.run(debug=os.environ.get("FLASK_DEBUG") == "1", threaded=True)
 